@@ -0,0 +1,14 @@
+import os
+from datetime import datetime
+
+def log_info(message):
+    """Write a status or error message to the log file for debugging"""
+    try:
+        log_path = os.path.join(os.path.dirname(__file__), "etl_error.log")
+        with open(log_path, "a") as f:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            f.write(f"\n{'='*60}\n")
+            f.write(f"[{timestamp}]\n")
+            f.write(f"{message}\n")
+    except:
+        pass
@@ -4,6 +4,7 @@ import xlwings as xw
 class Extract:
     def __init__(self, workbook: xw.Book, sheet_name: str):
         self.workbook = workbook
+        self.app = workbook.app
         self.sheet_name = sheet_name
         self.header_row_index = 1
         self.cols = ("Sample ID", "Sample Type", "Mean (per analysis type)", "PPM", "Adjusted ABS")
@@ -14,26 +15,31 @@ class Extract:
         for column in self.cols:
             wanted_columns.add(column.strip())
         
-        # Read the entire sheet into a DataFrame, then filter columns
+        # Read the header row first, then pull only the wanted columns from the sheet
         try:
-            # Read all data from the active sheet to allow for column filtering post-read
-            # xlwings reads directly into a DataFrame
-            # Get the used range and convert to DataFrame with proper headers
             ws = self.workbook.sheets[self.sheet_name]
-            df = ws.used_range.options(pd.DataFrame, header=1, index=False).value
+            used_range = ws.used_range
+            header_row = used_range.row + self.header_row_index - 1
+            first_col = used_range.column
+            last_cell = used_range.last_cell
+            last_row = last_cell.row
+
+            header = ws.range((header_row, first_col), (header_row, last_cell.column)).options(ndim=1).value
+
+            # Match on the stripped header text but keep the original text as the column name
+            data = {}
+            for col_idx, col in enumerate(header, start=first_col):
+                if isinstance(col, str) and col.strip() in wanted_columns and col not in data:
+                    column_range = ws.range((header_row + 1, col_idx), (last_row, col_idx))
+                    data[col] = column_range.options(ndim=1).value if last_row > header_row else []
+            df = pd.DataFrame(data)
 
-            # Filter columns after reading
-            # Convert column names to strings and strip whitespace
-            actual_columns = [col for col in df.columns if isinstance(col, str) and col.strip() in wanted_columns]
-            df = df[actual_columns]
-            
             if len(df) > 0:
-                xw.apps.active.alert(f"Successfully loaded {len(df)} rows from sheet '{self.sheet_name}'", "ETL Pipeline")
                 return df
             else:
-                xw.apps.active.alert(f"No data found in sheet '{self.sheet_name}'.", "ETL Pipeline Error")
+                self.app.alert(f"No data found in sheet '{self.sheet_name}'.", "ETL Pipeline Error")
                 return None
 
         except Exception as e:
-            xw.apps.active.alert(f"Error extracting data from sheet '{self.sheet_name}': {e}", "ETL Pipeline Error")
+            self.app.alert(f"Error extracting data from sheet '{self.sheet_name}': {e}", "ETL Pipeline Error")
             return None
\ No newline at end of file
@@ -1,61 +1,103 @@
+import numpy as np
 import pandas as pd
 import xlwings as xw
+from etl_log import log_info
+
+# Sample ID categories (upper-cased): fixed names, plus prefixes that take a numeric suffix (CCV1, CCB2, ...)
+_QC_NAMES = frozenset({"MDL", "ICV"})
+_QC_PREFIXES = ("CCV",)
+_QCB_NAMES = frozenset({"ICB"})
+_QCB_PREFIXES = ("CCB",)
+_NON_SAMPLE_NAMES = _QC_NAMES | _QCB_NAMES | {"RINSE"}
+_NON_SAMPLE_PREFIXES = _QC_PREFIXES + _QCB_PREFIXES
+
+# Known concentrations (ppm) used as the %R target for QC samples; every numbered CCV shares one target
+_QC_TARGETS = {"MDL": 0.2, "ICV": 18.0}
+_CCV_TARGET = 10.0
+
+# Workbook cell style applied to out-of-bounds values
+_OUT_OF_BOUNDS_STYLE = "ETLOutOfBounds"
 
 class Load:
     def __init__(self, transformer, workbook: xw.Book):
         self.transformer = transformer
         self.workbook = workbook
+        self.app = workbook.app
         self.molecular_weight = 12.01057
+        self._clean_cache = None
+        self._upper_ids_cache = None
+        self._groups_cache = None
+        self._group_stats = None
+        self.qc_df = None
+        self.samples_df = None
+        self.output_sheets = {}
 
     @staticmethod
-    def is_out_of_bounds(value, check_type):
-        try:
-            val = float(value)
-        except (ValueError, TypeError):
-            return False
-        
+    def is_out_of_bounds(values, check_type):
+        """Boolean mask of a column's values outside the limits for check_type (non-numeric values pass)"""
+        vals = pd.to_numeric(pd.Series(values), errors="coerce")
+
         if check_type == 'QC_R':
-            return val < 90 or val > 110
+            return (vals < 90) | (vals > 110)
         elif check_type == 'MDL_R':
-            return val < 45 or val > 145
+            return (vals < 45) | (vals > 145)
         elif check_type == 'RPD':
-            return val > 10
+            return vals > 10
         else:
-            return False
+            return pd.Series(False, index=vals.index)
+
+    @staticmethod
+    def match_sample_ids(upper_ids, names, numbered_prefixes):
+        """Mask of upper-cased Sample IDs equal to one of names or to a prefix followed by digits"""
+        mask = upper_ids.isin(names)
+        for prefix in numbered_prefixes:
+            mask |= upper_ids.str.startswith(prefix, na=False) & upper_ids.str.slice(len(prefix)).str.isdigit()
+        return mask.fillna(False).astype(bool)
+
+    def cleaned_samples(self):
+        """Samples-only rows with stripped Sample IDs, computed once per Load"""
+        if self._clean_cache is None:
+            df = self.transformer.clean_data().copy()
+            df["Sample ID"] = df["Sample ID"].astype("string").str.strip()
+            self._clean_cache = df
+        return self._clean_cache
+
+    def upper_sample_ids(self):
+        """Upper-cased Sample IDs aligned with cleaned_samples(), computed once for all case-insensitive checks"""
+        if self._upper_ids_cache is None:
+            self._upper_ids_cache = self.cleaned_samples()["Sample ID"].str.upper()
+        return self._upper_ids_cache
 
     def sample_groups(self):
-        cleaned = self.transformer.clean_data()
-        df = cleaned.copy()
-        df["Sample ID"] = df["Sample ID"].astype("string").str.strip()
-        qc_pattern = r"(?i)^(MDL|ICV|ICB|CCV\d+|CCB\d+|Rinse)$"
-        samples_only = df[~df["Sample ID"].str.match(qc_pattern, na=False)]
-        ordered_ids = self.get_unique_ordered_ids(samples_only)
-        groups = self.build_sample_groups(samples_only, ordered_ids)
-        return samples_only, groups
-
-    def get_unique_ordered_ids(self, df):
-        ordered_ids = []
-        seen = set()
-        for sid in df["Sample ID"]:
-            if sid not in seen:
-                seen.add(sid)
-                ordered_ids.append(sid)
-        return ordered_ids
-
-    def build_sample_groups(self, df, ordered_ids):
-        groups = []
-        for sample_id in ordered_ids:
-            group_df = df[df["Sample ID"] == sample_id]
-            groups.append((sample_id, group_df))
-        return groups
+        if self._groups_cache is not None:
+            return self._groups_cache
+
+        df = self.cleaned_samples()
+        non_sample_mask = self.match_sample_ids(self.upper_sample_ids(), _NON_SAMPLE_NAMES, _NON_SAMPLE_PREFIXES)
+        samples_only = df[~non_sample_mask]
+        groups = list(samples_only.groupby("Sample ID", sort=False))
+        self._groups_cache = (samples_only, groups)
+        return self._groups_cache
+
+    def group_stats(self):
+        """Per-sample Mean ppm C, %RPD and umol/L C indexed by Sample ID, shared by the Samples and Reported Results sheets"""
+        if self._group_stats is None:
+            samples_only, _ = self.sample_groups()
+            self._group_stats = self.compute_group_stats(samples_only)
+        return self._group_stats
+
+    def compute_group_stats(self, samples_only):
+        stats = self.transformer.summarize_groups(samples_only)
+        stats = stats.rename(columns={"mean_ppm": "Mean ppm C", "rpd": "%RPD"})
+        stats["umol/L C"] = self.transformer.convert_to_umol_per_L(stats["Mean ppm C"], self.molecular_weight)
+        return stats
 
     def format_qc(self):
-        df = self.transformer.df
-        samples = df[df["Sample Type"] == "Samples"].copy()
-        samples["Sample ID"] = samples["Sample ID"].astype("string").str.strip()
+        samples = self.cleaned_samples()
+        upper_ids = self.upper_sample_ids()
 
-        qc_mask = samples["Sample ID"].str.match(r"(?i)^(MDL|ICV|CCV\d+)$", na=False)
-        qcb_mask = samples["Sample ID"].str.match(r"(?i)^(ICB|CCB\d+)$", na=False)
+        qc_mask = self.match_sample_ids(upper_ids, _QC_NAMES, _QC_PREFIXES)
+        qcb_mask = self.match_sample_ids(upper_ids, _QCB_NAMES, _QCB_PREFIXES)
         qc_samples = samples[qc_mask]
         qcb_samples = samples[qcb_mask]
 
@@ -70,34 +112,16 @@ class Load:
         return pd.DataFrame(records, columns=columns)
 
     def build_qc_records(self, qc_samples, add_bounds_once=False):
-        qc_targets = {"MDL": 0.2, "ICV": 18.0}
+        summaries = self.compute_qc_stats(qc_samples).to_dict("index")
         records = []
         bounds_added = False
 
-        for sample_id in qc_samples["Sample ID"].unique():
-            group_df = qc_samples[qc_samples["Sample ID"] == sample_id]
-            group_records = []
-            sample_id_upper = str(sample_id).upper()
-
-            for _, row in group_df.iterrows():
-                group_records.append({
-                    "Sample ID": row["Sample ID"],
-                    "PPM C": row.get("PPM"),
-                    "Mean ppm C": None,
-                    "%R": None,
-                    "%RPD": None,
-                    "Bounds": None
-                })
-            mean_ppm = self.transformer.calculate_mean_ppm(group_df)
-            target = 10.0 if sample_id_upper.startswith("CCV") else qc_targets.get(sample_id_upper)
-            percent_r = self.transformer.calculate_percent_R(group_df, target_override=target)
-            rpd = self.transformer.calculate_rpd(group_df, mean_ppm)
+        for sample_id, group_df in qc_samples.groupby("Sample ID", sort=False):
+            group_records = self.build_ppm_records(group_df, ("Mean ppm C", "%R", "%RPD", "Bounds"))
 
             # Add summary values to last row
             last_record = group_records[-1]
-            last_record["Mean ppm C"] = mean_ppm
-            last_record["%R"] = percent_r
-            last_record["%RPD"] = rpd
+            last_record.update(summaries[sample_id])
 
             # Add bounds only to the very first data row
             if add_bounds_once and not bounds_added:
@@ -109,11 +133,16 @@ class Load:
             records.extend(group_records)
         return records
 
+    def compute_qc_stats(self, qc_samples):
+        # Mean, %RPD and %R for every QC sample from one groupby, against each sample's known concentration
+        sample_ids = pd.Index(qc_samples["Sample ID"].dropna().unique())
+        upper_ids = sample_ids.str.upper()
+        targets = pd.Series(upper_ids.map(_QC_TARGETS), index=sample_ids).where(~upper_ids.str.startswith("CCV"), _CCV_TARGET)
+        stats = self.transformer.summarize_groups(qc_samples, targets=targets)
+        return stats.rename(columns={"mean_ppm": "Mean ppm C", "rpd": "%RPD", "percent_r": "%R"})
+
     def build_qcb_records(self, qcb_samples):
-        records = []
-        for _, row in qcb_samples.iterrows():
-            records.append({"Sample ID": row["Sample ID"], "PPM C": row.get("PPM"), "Mean ppm C": None, "%R": None, "%RPD": None, "Bounds": None})
-        return records
+        return self.build_ppm_records(qcb_samples, ("Mean ppm C", "%R", "%RPD", "Bounds"))
 
     def build_qcb_average(self, qcb_samples):
         average_ppm = self.transformer.calculate_mean_ppm(qcb_samples)
@@ -121,13 +150,14 @@ class Load:
 
     def format_samples(self):
         samples_only, groups = self.sample_groups()
+        summaries = self.group_stats().to_dict("index")
         columns = ["Sample ID", "PPM C", "Mean ppm C", "%RPD", "umol/L C", "Bounds"]
         records = []
         bounds_added = False
 
         for sample_id, group_df in groups:
             group_records = self.build_sample_group_records(group_df)
-            self.add_summary_to_last_record(group_df, group_records)
+            self.add_summary_to_last_record(summaries[sample_id], group_records)
 
             # Add bounds only to the very first data row
             if not bounds_added:
@@ -138,43 +168,48 @@ class Load:
         return pd.DataFrame(records, columns=columns)
 
     def build_sample_group_records(self, group_df):
-        group_records = []
-        for _, row in group_df.iterrows():
-            group_records.append({"Sample ID": row["Sample ID"], "PPM C": row.get("PPM"), "Mean ppm C": None, "%RPD": None, "umol/L C": None, "Bounds": None})
-        return group_records
-
-    def add_summary_to_last_record(self, group_df, group_records):
-        mean_ppm = self.transformer.calculate_mean_ppm(group_df)
-        rpd = self.transformer.calculate_rpd(group_df, mean_ppm)
-        mean_umol = self.transformer.convert_to_umol_per_L(mean_ppm, self.molecular_weight)
+        return self.build_ppm_records(group_df, ("Mean ppm C", "%RPD", "umol/L C", "Bounds"))
+
+    @staticmethod
+    def build_ppm_records(df, blank_columns):
+        """One record per row with Sample ID and PPM C filled in and blank_columns set to None"""
+        records = df[["Sample ID", "PPM"]].rename(columns={"PPM": "PPM C"}).to_dict("records")
+        blanks = dict.fromkeys(blank_columns)
+        for record in records:
+            record.update(blanks)
+        return records
+
+    def add_summary_to_last_record(self, summary, group_records):
         last_record = group_records[-1]
-        last_record["Mean ppm C"] = mean_ppm
-        last_record["%RPD"] = rpd
-        last_record["umol/L C"] = mean_umol
+        last_record.update(summary)
         last_record["Bounds"] = None
 
     def format_reported_results(self):
-        _, groups = self.sample_groups()
-        records = []
-        for sample_id, group_df in groups:
-            mean_ppm = self.transformer.calculate_mean_ppm(group_df)
-            umol = self.transformer.convert_to_umol_per_L(mean_ppm, self.molecular_weight)
-            records.append({"Sample ID": sample_id, "umol/L C": umol})
-        return pd.DataFrame(records, columns=["Sample ID", "umol/L C"])
+        return self.group_stats()[["umol/L C"]].reset_index()
 
     def export_all(self):
+        app = self.app
         try:
-            self.write_sheets()
-            self.apply_formatting()
-            self.cleanup_xlwings_config()
+            # Suspend repaints, prompts and recalculation while the sheets are rebuilt,
+            # then restore the user's settings even if the export fails
+            settings = (app.screen_updating, app.display_alerts, app.calculation)
+            app.screen_updating = False
+            app.display_alerts = False
+            app.calculation = 'manual'
+            try:
+                self.write_sheets()
+                self.apply_formatting()
+                self.cleanup_xlwings_config()
+            finally:
+                app.screen_updating, app.display_alerts, app.calculation = settings
         except Exception as e:
             # If anything fails, show the specific error
-            xw.apps.active.alert(f"Error during export: {type(e).__name__}: {str(e)}", "ETL Pipeline Error")
+            self.app.alert(f"Error during export: {type(e).__name__}: {str(e)}", "ETL Pipeline Error")
 
     def cleanup_xlwings_config(self):
         """Remove the _xlwings.conf sheet if it exists"""
         try:
-            if '_xlwings.conf' in [sheet.name for sheet in self.workbook.sheets]:
+            if '_xlwings.conf' in {sheet.name for sheet in self.workbook.sheets}:
                 self.workbook.sheets['_xlwings.conf'].delete()
         except Exception:
             pass  # Ignore if deletion fails
@@ -184,6 +219,11 @@ class Load:
         samples_df = self.format_samples()
         results_df = self.format_reported_results()
 
+        # Keep the written frames and sheets so formatting works from memory
+        # instead of re-reading or looking up the sheets over COM
+        self.qc_df = qc_df
+        self.samples_df = samples_df
+
         sheets_to_write = {
             "QC": qc_df,
             "Samples": samples_df,
@@ -192,9 +232,11 @@ class Load:
 
         # Get the last sheet to add new sheets after it (to the right)
         last_sheet = self.workbook.sheets[-1]
+        # Look up sheet names once; each .name is a COM call
+        existing_sheets = {sheet.name for sheet in self.workbook.sheets}
 
         for sheet_name, df in sheets_to_write.items():
-            if sheet_name in [sheet.name for sheet in self.workbook.sheets]:
+            if sheet_name in existing_sheets:
                 ws = self.workbook.sheets[sheet_name]
                 ws.clear_contents()
             else:
@@ -202,78 +244,128 @@ class Load:
                 ws = self.workbook.sheets.add(sheet_name, after=last_sheet)
                 last_sheet = ws  # Update last_sheet so next one goes after this
 
-            # Write DataFrame without index - use options to exclude index column
-            ws.range('A1').options(index=False).value = df
+            # Write header + values as one sized block (no index column) so xlwings
+            # assigns the array in a single call without its DataFrame converter
+            ws.range((1, 1), (len(df) + 1, len(df.columns))).value = self.frame_to_values(df)
+            self.output_sheets[sheet_name] = ws
+
+    @staticmethod
+    def frame_to_values(df):
+        """Header row followed by data rows as plain lists, with missing values as None"""
+        # Replace NaN/NA in one vectorized pass so xlwings gets plain values
+        values = np.where(df.isna().to_numpy(), None, df.to_numpy(dtype=object)).tolist()
+        return [df.columns.tolist()] + values
 
     def apply_formatting(self):
         # Windows Excel COM API expects BGR integer format, not RGB tuple
         # Red in BGR: Blue=0, Green=0, Red=255 -> 0x0000FF = 255
         red_font_color = 255  # BGR format as integer
-        self.format_qc_sheet(red_font_color)
-        self.format_samples_sheet(red_font_color)
-
-    def format_qc_sheet(self, red_font_color):
         try:
-            ws = self.workbook.sheets['QC']
-            used_range = ws.used_range
-            max_row = used_range.last_cell.row
-
-            # Find the %R column by reading the header row
-            header_row = ws.range('1:1').value
-            r_col_idx = None
-            for idx, header in enumerate(header_row, start=1):
-                if header == '%R':
-                    r_col_idx = idx
-                    break
-
-            if r_col_idx is None:
-                return  # %R column not found
-
-            for row_idx in range(2, max_row + 1):
-                try:
-                    sample_id_cell = ws.range((row_idx, 1))
-                    sample_id = sample_id_cell.value
-                    r_cell = ws.range((row_idx, r_col_idx))
-                    if r_cell.value is not None:
-                        # Determine check type based on sample ID
-                        if sample_id and 'MDL' in str(sample_id).upper():
-                            check_type = 'MDL_R'
-                        else:
-                            check_type = 'QC_R'
-
-                        if self.is_out_of_bounds(r_cell.value, check_type):
-                            # Apply red font color using xlwings font property
-                            r_cell.font.color = (255, 0, 0)
-                except Exception:
-                    continue  # Skip this row if there's an error
+            style_name = self.out_of_bounds_style(red_font_color)
+        except Exception as e:
+            # e.g. protected or shared workbooks; still highlight by setting the font color directly
+            log_info(f"Could not create cell style '{_OUT_OF_BOUNDS_STYLE}', falling back to font color: {type(e).__name__}: {e}")
+            style_name = None
+        self.format_qc_sheet(style_name, red_font_color)
+        self.format_samples_sheet(style_name, red_font_color)
+
+    def out_of_bounds_style(self, red_font_color):
+        """Create (or reuse) a workbook style with a red Normal font, and return its name"""
+        styles = self.workbook.api.Styles
+        try:
+            style = styles.Item(_OUT_OF_BOUNDS_STYLE)
+        except Exception:
+            style = styles.Add(_OUT_OF_BOUNDS_STYLE)
+        # Leave number format, alignment, borders, fill and protection of styled cells untouched.
+        # The font is included as a whole, so styled cells also take Normal's font name, size, bold and italic
+        style.IncludeNumber = False
+        style.IncludeAlignment = False
+        style.IncludeBorder = False
+        style.IncludePatterns = False
+        style.IncludeProtection = False
+        style.IncludeFont = True
+        style.Font.Color = red_font_color
+        return _OUT_OF_BOUNDS_STYLE
+
+    def format_qc_sheet(self, style_name, red_font_color):
+        try:
+            ws = self.output_sheets['QC']
+            qc_df = self.qc_df
+            r_col_idx = qc_df.columns.get_loc('%R') + 1
+
+            # MDL rows use the wider %R limits, everything else the ICV/CCV limits
+            is_mdl = qc_df["Sample ID"].astype(str).str.upper().str.contains("MDL", regex=False)
+            mdl_bad = self.is_out_of_bounds(qc_df["%R"], 'MDL_R')
+            qc_bad = self.is_out_of_bounds(qc_df["%R"], 'QC_R')
+            bad = (is_mdl & mdl_bad) | (~is_mdl & qc_bad)
+
+            self.highlight_rows(ws, r_col_idx, self.sheet_rows(bad), style_name, red_font_color)
         except Exception:
             pass  # If sheet formatting fails completely, continue
 
-    def format_samples_sheet(self, red_font_color):
+    def format_samples_sheet(self, style_name, red_font_color):
         try:
-            ws = self.workbook.sheets['Samples']
-            used_range = ws.used_range
-            max_row = used_range.last_cell.row
-
-            # Find the %RPD column by reading the header row
-            header_row = ws.range('1:1').value
-            rpd_col_idx = None
-            for idx, header in enumerate(header_row, start=1):
-                if header == '%RPD':
-                    rpd_col_idx = idx
-                    break
-
-            if rpd_col_idx is None:
-                return  # %RPD column not found
-
-            for row_idx in range(2, max_row + 1):
-                try:
-                    rpd_cell = ws.range((row_idx, rpd_col_idx))
-                    if rpd_cell.value is not None:
-                        if self.is_out_of_bounds(rpd_cell.value, 'RPD'):
-                            # Apply red font color using xlwings font property
-                            rpd_cell.font.color = (255, 0, 0)
-                except Exception:
-                    continue  # Skip this row if there's an error
+            ws = self.output_sheets['Samples']
+            samples_df = self.samples_df
+            rpd_col_idx = samples_df.columns.get_loc('%RPD') + 1
+
+            bad = self.is_out_of_bounds(samples_df["%RPD"], 'RPD')
+            self.highlight_rows(ws, rpd_col_idx, self.sheet_rows(bad), style_name, red_font_color)
         except Exception:
-            pass  # If sheet formatting fails completely, continue
\ No newline at end of file
+            pass  # If sheet formatting fails completely, continue
+
+    @staticmethod
+    def sheet_rows(mask):
+        """Excel row numbers of the True entries in mask, for a frame written below a header row"""
+        return (mask.to_numpy().nonzero()[0] + 2).tolist()
+
+    @staticmethod
+    def contiguous_runs(row_indices):
+        """Group sorted row indices into (first, last) runs of consecutive rows"""
+        runs = []
+        for row_idx in row_indices:
+            if runs and row_idx == runs[-1][1] + 1:
+                runs[-1][1] = row_idx
+            else:
+                runs.append([row_idx, row_idx])
+        return [tuple(run) for run in runs]
+
+    @staticmethod
+    def column_letter(col_idx):
+        """Excel column letters for a 1-based column index (1 -> A, 27 -> AA)"""
+        letters = ""
+        while col_idx:
+            col_idx, remainder = divmod(col_idx - 1, 26)
+            letters = chr(ord("A") + remainder) + letters
+        return letters
+
+    @staticmethod
+    def union_addresses(col_letter, row_indices, max_length=255):
+        """Comma-joined addresses ("D5,D9:D11") for the rows, split to stay within Excel's Range() length limit"""
+        addresses = []
+        current = ""
+        for first_row, last_row in Load.contiguous_runs(row_indices):
+            if first_row == last_row:
+                address = f"{col_letter}{first_row}"
+            else:
+                address = f"{col_letter}{first_row}:{col_letter}{last_row}"
+            if current and len(current) + 1 + len(address) > max_length:
+                addresses.append(current)
+                current = address
+            else:
+                current = f"{current},{address}" if current else address
+        if current:
+            addresses.append(current)
+        return addresses
+
+    def highlight_rows(self, ws, col_idx, row_indices, style_name, red_font_color):
+        # Highlight every out-of-bounds cell through a single union Range per address batch,
+        # with the named style when available and the plain font color otherwise
+        for address in self.union_addresses(self.column_letter(col_idx), row_indices):
+            try:
+                if style_name is not None:
+                    ws.api.Range(address).Style = style_name
+                else:
+                    ws.api.Range(address).Font.Color = red_font_color
+            except Exception:
+                continue  # Skip this batch if there's an error
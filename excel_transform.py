@@ -30,29 +30,29 @@ class Transform:
         return df["PPM"].mean()
 
 
-    def calculate_rpd(self, df, mean_ppm):
-        values = df["PPM"].dropna().tolist()
-        v1 = float(values[-2])
-        v2 = float(values[-1])
-        rpd = abs(v1 - v2) / mean_ppm * 100.0
-        return rpd
-
-
-    def calculate_percent_R(self, df, target_override=None):
-        values = df["PPM"].dropna()
-        mean_value = float(values.mean())
-        
-        if target_override is not None:
-            target = float(target_override)
-        else:
-            targets = df["Mean (per analysis type)"].dropna()
-            target = float(targets.iloc[0])
-        
-        percent_r = mean_value / target * 100.0
-        return percent_r
+    def summarize_groups(self, df, group_col="Sample ID", targets=None):
+        # Mean PPM, RPD and (when targets are given) %R for every group in one groupby pass
+        # RPD: abs(v1 - v2) / mean_ppm * 100 over the last two PPM readings; fewer than two readings gives NaN
+        # %R: mean_ppm / target * 100, with targets mapping each group key to its known concentration
+        mean_ppm = df.groupby(group_col, sort=False)["PPM"].mean()
+        readings = df.dropna(subset=["PPM"])
+        ppm = readings.groupby(group_col, sort=False)["PPM"]
+        last_two = readings.assign(previous=ppm.shift()).groupby(group_col, sort=False)
+        v1 = last_two["previous"].last().reindex(mean_ppm.index)
+        v2 = last_two["PPM"].last().reindex(mean_ppm.index)
+        rpd = (v1 - v2).abs() / mean_ppm * 100.0
+        summary = pd.DataFrame({"mean_ppm": mean_ppm, "rpd": rpd})
+
+        if targets is not None:
+            target = pd.Series(targets, dtype=float).reindex(mean_ppm.index)
+            summary["percent_r"] = mean_ppm / target * 100.0
+        return summary
 
 
     def convert_to_umol_per_L(self, ppm_value, molecular_weight):
         # Formula: ppm * 1000 / molecular_weight 
         # For carbon (12.01057): 1000/12.01057 ≈ 83.26 (used in Excel)
+        # Accepts a single value or a whole PPM column
+        if isinstance(ppm_value, pd.Series):
+            return ppm_value.astype(float) * 1000.0 / molecular_weight
         return float(ppm_value) * 1000.0 / molecular_weight
\ No newline at end of file